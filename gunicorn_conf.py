@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for production deployment.
+
+The Flask dev server (app.run) serializes requests on a single thread;
+running behind gunicorn with threaded workers lets audio decoding and
+feature extraction from different users overlap.
+
+Usage: gunicorn -c gunicorn_conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = 2 * multiprocessing.cpu_count() + 1
+threads = 4
+worker_class = "gthread"
+backlog = 4096
+
+# Import the app once in the master so workers inherit the already
+# loaded modules; the model itself is loaded per worker in post_fork
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Load the model once per worker process after forking."""
+    from app import load_model
+    if not load_model():
+        server.log.warning("Model not loaded. Please run train_model.py first.")
@@ -8,7 +8,7 @@ import pandas as pd
 import requests
 import os
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
@@ -71,29 +71,57 @@ def create_synthetic_features():
     This ensures the model can still be trained for demonstration.
     """
     print("Creating synthetic dataset for demonstration...")
-    np.random.seed(42)
-    
+
     n_samples = 200
     n_features = 34  # Match our feature extractor output (4 basic + 13 MFCC + 8 spectral + 9 statistical)
-    
-    # Generate synthetic features
-    X = np.random.randn(n_samples, n_features)
-    
-    # Create labels (0=healthy, 1=Parkinson's)
-    # Make it somewhat realistic: higher jitter/shimmer -> higher probability of Parkinson's
-    jitter_idx = 1  # Assuming jitter is at index 1
-    shimmer_idx = 2  # Assuming shimmer is at index 2
-    
-    # Create labels based on jitter and shimmer values
-    y = ((X[:, jitter_idx] > 0.5) | (X[:, shimmer_idx] > 0.5)).astype(int)
-    
-    # Ensure some balance
-    y[:n_samples//2] = 0
-    y[n_samples//2:] = 1
-    
+
+    # Generate synthetic features in float32 directly; the new Generator
+    # API fills the typed array in one call instead of allocating float64
+    # and downcasting
+    rng = np.random.default_rng(42)
+    X = rng.standard_normal((n_samples, n_features), dtype=np.float32)
+
+    # Create balanced labels (0=healthy, 1=Parkinson's) in one construction
+    y = np.concatenate([
+        np.zeros(n_samples // 2, dtype=np.int8),
+        np.ones(n_samples - n_samples // 2, dtype=np.int8),
+    ])
+
     return X, y
 
 
+def export_onnx(model, scaler):
+    """Export scaler + model as one ONNX graph for onnxruntime inference.
+
+    The app loads 'parkinsons_model.onnx' when onnxruntime is available
+    and feeds it raw (unscaled) features, so the scaler is baked into
+    the graph; zipmap is disabled so the second output is the plain
+    (n_samples, 2) probability array the app expects.
+    """
+    try:
+        from skl2onnx import convert_sklearn
+        from skl2onnx.common.data_types import FloatTensorType
+        from sklearn.pipeline import make_pipeline
+    except ImportError:
+        print("skl2onnx not installed; skipping ONNX export.")
+        return False
+
+    try:
+        pipeline = make_pipeline(scaler, model)
+        onnx_model = convert_sklearn(
+            pipeline,
+            initial_types=[('input', FloatTensorType([None, scaler.n_features_in_]))],
+            options={id(model): {'zipmap': False}}
+        )
+        with open('parkinsons_model.onnx', 'wb') as f:
+            f.write(onnx_model.SerializeToString())
+        print("ONNX model saved as 'parkinsons_model.onnx'")
+        return True
+    except Exception as e:
+        print(f"ONNX export failed: {e}")
+        return False
+
+
 def train_model():
     """Train the Parkinson's detection model."""
     print("=" * 50)
@@ -118,23 +146,26 @@ def train_model():
         X, y, test_size=0.2, random_state=42, stratify=y
     )
     
-    # Scale features
-    scaler = StandardScaler()
+    # Scale features in place; sklearn preserves the float32 dtype, so
+    # the whole training path stays single precision
+    scaler = StandardScaler(copy=False)
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
     
-    # Train Random Forest model
-    print("\nTraining Random Forest Classifier...")
-    rf_model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        random_state=42,
-        n_jobs=-1
+    # Train histogram gradient boosting model: features are binned to
+    # int8 histograms, so training and prediction are much faster than
+    # the previous 100-tree random forest at comparable accuracy
+    print("\nTraining Histogram Gradient Boosting Classifier...")
+    model = HistGradientBoostingClassifier(
+        max_iter=200,
+        max_depth=6,
+        learning_rate=0.1,
+        random_state=42
     )
-    rf_model.fit(X_train_scaled, y_train)
+    model.fit(X_train_scaled, y_train)
     
     # Evaluate
-    y_pred = rf_model.predict(X_test_scaled)
+    y_pred = model.predict(X_test_scaled)
     accuracy = accuracy_score(y_test, y_pred)
     
     print(f"\nModel Accuracy: {accuracy:.4f}")
@@ -143,16 +174,20 @@ def train_model():
     print("\nConfusion Matrix:")
     print(confusion_matrix(y_test, y_pred))
     
-    # Save model and scaler
-    joblib.dump(rf_model, 'parkinsons_model.pkl')
-    joblib.dump(scaler, 'scaler.pkl')
-    
+    # Save model and scaler: zlib-compressed pickles with protocol 5
+    # load noticeably faster cold (less I/O, out-of-band buffers)
+    joblib.dump(model, 'parkinsons_model.pkl', compress=3, protocol=5)
+    joblib.dump(scaler, 'scaler.pkl', compress=3, protocol=5)
+
+    # Optional ONNX export for the app's onnxruntime fast path
+    export_onnx(model, scaler)
+
     print("\n" + "=" * 50)
     print("Model saved as 'parkinsons_model.pkl'")
     print("Scaler saved as 'scaler.pkl'")
     print("=" * 50)
-    
-    return rf_model, scaler
+
+    return model, scaler
 
 
 if __name__ == "__main__":